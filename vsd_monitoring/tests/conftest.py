@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are scripts importing each other by name, so make their directory importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,38 @@
+import vsd_monitor
+from vsd_monitor import SCALING_FACTORS, VALID_RANGES, decode_status, grid_format, scale_registers
+
+def test_decode_status_reads_bits_2_3_and_7():
+    assert decode_status([0, 0, 0, 0, 0, 0, 0, 0]) == ("STOP", "NORMAL", "NORMAL")
+    assert decode_status([0, 0, 1, 0, 0, 0, 0, 0]) == ("RUN", "NORMAL", "NORMAL")
+    assert decode_status([0, 0, 0, 1, 0, 0, 0, 0]) == ("STOP", "FAULT", "NORMAL")
+    assert decode_status([0, 0, 0, 0, 0, 0, 0, 1]) == ("STOP", "NORMAL", "ALARM")
+    assert decode_status([True, True, True, True, True, True, True, True]) == ("RUN", "FAULT", "ALARM")
+
+def test_decode_status_ignores_other_bits():
+    assert decode_status([1, 1, 0, 0, 1, 1, 1, 0]) == ("STOP", "NORMAL", "NORMAL")
+
+def test_scale_registers_scales_values():
+    registers = [500, 1234, 255, 0, -500, 1000, 1, 423]
+
+    values = scale_registers(1, 40103, registers, SCALING_FACTORS, VALID_RANGES)
+
+    assert values == [50.0, 123.4, 25.5, 0.0, -50.0, 100.0, 0.1, 42.3]
+    assert all(type(value) is float for value in values)
+
+def test_scale_registers_replaces_out_of_range_values_with_none(capsys):
+    registers = [501, 2001, 255, 0, -501, 1001, 1, 423]
+
+    values = scale_registers(1, 40103, registers, SCALING_FACTORS, VALID_RANGES)
+
+    assert values == [None, None, 25.5, 0.0, None, None, 0.1, 42.3]
+    output = capsys.readouterr().out
+    assert f"{vsd_monitor.VSD_NAMES[1]}: Register 40103 value 50.1 out of range (0.0, 50.0)" in output
+    assert "Register 40107 value -50.1" in output
+
+def test_grid_format_aligns_header_and_row():
+    border, header_line, row_format = grid_format(["Date", "Time", "CT_9", "Status_CHWP_6"])
+    row_line = row_format.format("2024-12-31", "13:14", 42.3, "NORMAL")
+
+    assert border == "+------------+-------+--------+---------------+"
+    assert len(header_line) == len(row_line) == len(border)
+    assert row_line == "| 2024-12-31 | 13:14 |   42.3 |        NORMAL |"
@@ -0,0 +1,195 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import vsd_monitor
+import vsd_monitoring_logging as backend
+from vsd_config import VSD_NAMES
+
+NAMES = list(VSD_NAMES.values())
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    Point the SQLite backend at an empty database file in a temporary directory.
+    """
+    path = str(tmp_path / "vsd_read.db")
+    monkeypatch.setattr(backend, "DATABASE_NAME", path)
+    return path
+
+def run_backend(*steps):
+    """
+    Open the backend's connection, run the given coroutine functions in order and close it again.
+    """
+    async def run():
+        await backend.initialize_database()
+        try:
+            for step in steps:
+                await step()
+        finally:
+            await backend.close_database()
+    asyncio.run(run())
+
+def create_legacy_table(conn, table_name, column_type, rows):
+    """
+    Create a per-reading table as written by older versions and fill it with (date, time, value) rows,
+    the value being stored for every unit.
+    """
+    columns = ", ".join(f"{name} {column_type}" for name in NAMES)
+    conn.execute(f"""
+        CREATE TABLE {table_name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            {columns}
+        )
+    """)
+    placeholders = ", ".join(["?"] * (2 + len(NAMES)))
+    conn.executemany(
+        f"INSERT INTO {table_name} (date, time, {', '.join(NAMES)}) VALUES ({placeholders})",
+        [[date, time] + [value] * len(NAMES) for date, time, value in rows],
+    )
+
+def view_rows(path, view_name):
+    """
+    Return (date, time, first unit's value) of every row of a view, oldest first.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT date, time, {NAMES[0]} FROM {view_name} ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+def test_save_cycles_round_trip(database):
+    readings = {name: [float(i) for i in range(len(NAMES))] for name in ("temperature", "current", "frequency")}
+    readings.update({"run": ["RUN"] * len(NAMES), "fault": ["NORMAL"] * len(NAMES), "alarm": [None] * len(NAMES)})
+    timestamp = 1735650840
+
+    run_backend(lambda: backend.save_cycles([(timestamp, readings), (timestamp + 60, readings)]))
+
+    conn = sqlite3.connect(database)
+    date, time = conn.execute(
+        "SELECT date(?, 'unixepoch', 'localtime'), strftime('%H:%M', ?, 'unixepoch', 'localtime')",
+        (timestamp, timestamp),
+    ).fetchone()
+    assert conn.execute("SELECT COUNT(*) FROM vsd_readings").fetchone() == (2,)
+    assert conn.execute("SELECT * FROM vsd_temp WHERE id = 1").fetchone() == (1, date, time, *readings["temperature"])
+    assert conn.execute("SELECT * FROM vsd_current WHERE id = 1").fetchone() == (1, date, time, *readings["current"])
+    assert conn.execute("SELECT * FROM vsd_freq WHERE id = 1").fetchone() == (1, date, time, *readings["frequency"])
+    assert conn.execute("SELECT * FROM vsd_run WHERE id = 1").fetchone() == (1, date, time, *readings["run"])
+    assert conn.execute("SELECT * FROM vsd_fault WHERE id = 1").fetchone() == (1, date, time, *readings["fault"])
+    assert conn.execute("SELECT * FROM vsd_alarm WHERE id = 1").fetchone() == (1, date, time, *readings["alarm"])
+    conn.close()
+
+def test_save_cycles_rolls_back_failed_batch(database):
+    readings = {name: [1.0] * len(NAMES) for name in backend.READINGS}
+    short_readings = dict(readings, temperature=[1.0] * (len(NAMES) - 1))
+
+    async def save_failing_batch():
+        try:
+            await backend.save_cycles([(1, readings), (2, short_readings)])
+        except Exception:
+            pass
+        await backend.save_cycles([(3, readings)])
+
+    run_backend(save_failing_batch)
+
+    conn = sqlite3.connect(database)
+    assert conn.execute("SELECT ts FROM vsd_readings").fetchall() == [(3,)]
+    conn.close()
+
+@pytest.mark.parametrize("switches", range(0, 40, 3))
+def test_cancelled_flush_saves_batch_once(database, monkeypatch, switches):
+    readings = {name: [1.0] * len(NAMES) for name in backend.READINGS}
+    monkeypatch.setattr(vsd_monitor, "PENDING_READINGS", [(i, readings) for i in range(10)])
+
+    async def cancel_flush_then_flush_again():
+        # Cancel the flush at a different point of the transaction each run, as Ctrl+C or SIGTERM would,
+        # then flush again as main() does on shutdown
+        flush = asyncio.create_task(vsd_monitor.flush_readings(backend))
+        for _ in range(switches):
+            await asyncio.sleep(0)
+        flush.cancel()
+        try:
+            await flush
+        except asyncio.CancelledError:
+            pass
+        await vsd_monitor.flush_readings(backend)
+
+    run_backend(cancel_flush_then_flush_again)
+
+    conn = sqlite3.connect(database)
+    assert conn.execute("SELECT COUNT(*) FROM vsd_readings").fetchone() == (10,)
+    conn.close()
+    assert vsd_monitor.PENDING_READINGS == []
+
+def test_upgrade_moves_legacy_rows_into_views(database):
+    conn = sqlite3.connect(database)
+    create_legacy_table(conn, "vsd_temp", "REAL", [
+        ("2024-12-18", "15:56", 30.0),
+        ("2024-12-18", "15:56", 31.0),  # Two cycles within the same minute
+        ("2024-12-18", "15:57", 32.0),
+    ])
+    create_legacy_table(conn, "vsd_current", "REAL", [
+        ("2024-12-18", "15:56", 10.0),
+        ("2024-12-18", "15:56", 11.0),
+        ("2024-12-18", "15:57", 12.0),
+    ])
+    # Added in a later version, so its ids start over and one cycle has no row
+    create_legacy_table(conn, "vsd_run", "TEXT", [
+        ("2024-12-18", "15:56", "STOP"),
+        ("2024-12-18", "15:57", "RUN"),
+    ])
+    conn.commit()
+    conn.close()
+
+    run_backend()
+
+    assert view_rows(database, "vsd_temp") == [
+        ("2024-12-18", "15:56", 30.0), ("2024-12-18", "15:56", 31.0), ("2024-12-18", "15:57", 32.0),
+    ]
+    assert view_rows(database, "vsd_current") == [
+        ("2024-12-18", "15:56", 10.0), ("2024-12-18", "15:56", 11.0), ("2024-12-18", "15:57", 12.0),
+    ]
+    assert view_rows(database, "vsd_run") == [
+        ("2024-12-18", "15:56", "STOP"), ("2024-12-18", "15:56", None), ("2024-12-18", "15:57", "RUN"),
+    ]
+    assert view_rows(database, "vsd_freq") == [
+        ("2024-12-18", "15:56", None), ("2024-12-18", "15:56", None), ("2024-12-18", "15:57", None),
+    ]
+
+    conn = sqlite3.connect(database)
+    object_types = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE name LIKE 'vsd_%'").fetchall())
+    conn.close()
+    assert object_types["vsd_temp"] == "view"
+    assert object_types["vsd_run"] == "view"
+
+def test_upgrade_runs_once(database):
+    conn = sqlite3.connect(database)
+    create_legacy_table(conn, "vsd_temp", "REAL", [("2024-12-18", "15:56", 30.0)])
+    conn.commit()
+    conn.close()
+
+    run_backend()
+    run_backend()
+
+    assert view_rows(database, "vsd_temp") == [("2024-12-18", "15:56", 30.0)]
+
+def test_failed_upgrade_keeps_legacy_tables(database):
+    conn = sqlite3.connect(database)
+    create_legacy_table(conn, "vsd_temp", "REAL", [("2024-12-18", "15:56", 30.0)])
+    # An index takes the name of a view, so creating the views fails after the old table was dropped
+    conn.execute("CREATE TABLE other (value INTEGER)")
+    conn.execute("CREATE INDEX vsd_alarm ON other (value)")
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_backend()
+
+    conn = sqlite3.connect(database)
+    object_types = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE name LIKE 'vsd_%'").fetchall())
+    conn.close()
+    assert object_types == {"vsd_temp": "table", "vsd_alarm": "index"}
+    assert view_rows(database, "vsd_temp") == [("2024-12-18", "15:56", 30.0)]
@@ -0,0 +1,9 @@
+# Configuration shared by the monitor and the database backends
+TOTAL_UNITS = 13            # Number of devices
+
+# VSD Names Mapping
+VSD_NAMES = {
+    1: "CT_9", 2: "CT_10", 3: "CT_11", 4: "CT_12",
+    5: "CT_13", 6: "CHWP_6", 7: "CHWP_7", 8: "CHWP_8",
+    9: "CHWP_9", 10: "CCP_6", 11: "CCP_7", 12: "CCP_8", 13: "CCP_9"
+}
@@ -1,169 +1,96 @@
 import asyncio
-from pymodbus.client import AsyncModbusTcpClient
-from pymodbus.exceptions import ModbusException
-from tabulate import tabulate
-import mysql.connector
-import datetime
-
-# Configuration
-MODBUS_IP = "10.27.102.5"  # Shared IP address
-MODBUS_PORT = 502           # Default Modbus TCP port
-TOTAL_UNITS = 13            # Number of devices
-READ_INTERVAL = 60          # Interval in seconds (1 minute)
+import aiomysql
+import sys
+import time
+
+from vsd_config import TOTAL_UNITS, VSD_NAMES
 
 # MySQL Database Configuration
 MYSQL_CONFIG = {
     "host": "localhost",
     "user": "root",          # Replace with your MySQL username
     "password": "",          # Leave empty for no password
-    "database": "vsd_monitoring",
+    "db": "vsd_monitoring",
+}
+
+# Table written for each reading
+TABLES = {
+    "temperature": "vsd_temp",
+    "current": "vsd_curr",
+    "frequency": "vsd_freq",
+    "run": "vsd_run",
+    # "fault": "vsd_fault",
+    # "alarm": "vsd_alarm",
 }
 
-# VSD Names Mapping
-VSD_NAMES = {
-    1: "CT_9", 2: "CT_10", 3: "CT_11", 4: "CT_12",
-    5: "CT_13", 6: "CHWP_6", 7: "CHWP_7", 8: "CHWP_8",
-    9: "CHWP_9", 10: "CCP_6", 11: "CCP_7", 12: "CCP_8", 13: "CCP_9"
+# Insert statements, built once per table
+COLUMN_LIST = ", ".join(VSD_NAMES.values())
+PLACEHOLDERS = ", ".join(["%s"] * (2 + TOTAL_UNITS))  # 2 for date and time, the rest for values
+INSERT_SQL = {
+    table_name: f"INSERT INTO {table_name} (date, time, {COLUMN_LIST}) VALUES ({PLACEHOLDERS})"
+    for table_name in TABLES.values()
 }
 
-def save_to_database(table_name, date, time, values):
+# Connection pool, created once by initialize_database()
+DB_POOL = None
+
+# Status tables only get a new row when a status changes; last row saved per table
+STATUS_TABLES = {"vsd_run", "vsd_fault", "vsd_alarm"}
+LAST_STATUS = {}
+
+async def initialize_database():
     """
-    Save a single row of readings to the specified MySQL database table.
+    Create the MySQL connection pool reused by save_cycles for the lifetime of the process.
+    Connections are recycled after an hour so they never outlive the server's wait_timeout.
+    No connection is opened until the first flush (minsize=0), so a server that is down at startup
+    only fails that flush, which is retried, instead of stopping the monitor.
     """
-    try:
-        # Connect to the MySQL database
-        connection = mysql.connector.connect(**MYSQL_CONFIG)
-        cursor = connection.cursor()
-
-        # Build placeholders dynamically
-        placeholders = ", ".join(["%s"] * (2 + TOTAL_UNITS))
-        insert_query = f"""
-            INSERT INTO {table_name} (date, time, {', '.join(VSD_NAMES.values())})
-            VALUES ({placeholders})
-        """
-
-        # Execute the query
-        cursor.execute(insert_query, [date, time] + values)
-        connection.commit()
-
-    except mysql.connector.Error as err:
-        print(f"Error saving to {table_name}: {err}")
-    finally:
-        if 'connection' in locals() and connection.is_connected():
-            cursor.close()
-            connection.close()
-
-async def read_vsd_data_batch(client, unit_id, start_register, count, scaling_factors, valid_ranges):
+    global DB_POOL
+    DB_POOL = await aiomysql.create_pool(minsize=0, maxsize=2, pool_recycle=3600, **MYSQL_CONFIG)
+
+async def close_database():
     """
-    Reads multiple registers from a Modbus unit asynchronously and extracts specified data.
+    Close the MySQL connection pool.
     """
-    try:
-        print(f"Reading unit {unit_id}, start_register {start_register}, count {count}")
-        address = start_register - 40001  # Adjust for zero-based addressing
-        response = await client.read_holding_registers(address, count=count, slave=unit_id)
-
-        if response.isError():
-            print(f"Error reading unit {unit_id}: {response}")
-            return [None] * count
-
-        values = []
-        for i, raw_value in enumerate(response.registers):
-            scaled_value = raw_value / scaling_factors[i]
-            valid_range = valid_ranges[i]
-            if valid_range[0] <= scaled_value <= valid_range[1]:
-                values.append(scaled_value)
-            else:
-                print(f"Unit {unit_id}, Register {start_register + i}: Value {scaled_value} out of range {valid_range}")
-                values.append(None)
-
-        return values
-
-    except Exception as e:
-        print(f"Exception reading unit {unit_id}: {e}")
-        return [None] * count
-
-async def read_vsd_status(client, unit_id, start_register):
+    if DB_POOL is not None:
+        DB_POOL.close()
+        await DB_POOL.wait_closed()
+
+async def save_cycles(cycles):
     """
-    Reads a coil register for the status (RUN/STOP) using discrete inputs.
+    Save buffered cycles to the MySQL database in a single transaction.
+    Status rows are skipped when they match the last row saved to the same table.
+
+    Parameters:
+    - cycles: List of (timestamp, readings) tuples, readings mapping each reading name to its values per unit.
     """
-    try:
-        address = start_register - 10001  # Adjust for zero-based addressing
-        response = await client.read_discrete_inputs(address=address, count=8, slave=unit_id)
-
-        if not response.isError():
-            bit_2 = response.bits[2]
-            bit_3 = response.bits[3]
-            bit_7 = response.bits[7]
-
-            return ["RUN" if bit_2 else "STOP", "FAULT" if bit_3 else "NORMAL", "ALARM" if bit_7 else "NORMAL"]
-        else:
-            print(f"Error reading discrete inputs from unit {unit_id}: {response}")
-            return [None, None, None]
-
-    except ModbusException as e:
-        print(f"ModbusException while reading status from unit {unit_id}: {e}")
-        return [None, None, None]
-    except Exception as e:
-        print(f"Exception while reading status from unit {unit_id}: {e}")
-        return [None, None, None]
-
-async def main():
-    # Create Modbus TCP client
-    async with AsyncModbusTcpClient(MODBUS_IP, port=MODBUS_PORT) as client:
-
-        while True:
-            # Record current date and time
-            now = datetime.datetime.now()
-            date = now.strftime("%Y-%m-%d")
-            time_str = now.strftime("%H:%M")
-
-            # Initialize data lists
-            temperatures, currents, frequencies = [], [], []
-            run_status, fault_status, alarm_status = [], [], []
-
-            for unit_id in range(1, TOTAL_UNITS + 1):
-                # Read temperature, current, and frequency
-                values = await read_vsd_data_batch(
-                client,
-                unit_id,
-                40103,
-                count=8,
-                scaling_factors=[10, 10, 10, 10, 10, 10, 10, 10],  # Example scaling factors for each register
-                 valid_ranges=[
-                (0, 50),   # Frequency: 0-50 Hz
-                (0, 200),  # Current: 0-200 A
-                (-50, 100), # Temperature: -50°C to 100°C
-                (0, 100),  # Add specific ranges for other registers as needed
-                (0, 100), 
-                (0, 100),
-                (0, 100),
-                (0, 100),  # Adjust or expand as needed for your registers
-                ]
-                )
-
-
-                frequency, current, temperature = values[0], values[1], values[7]
-                frequencies.append(frequency)
-                currents.append(current)
-                temperatures.append(temperature)
-
-                # Read status
-                status = await read_vsd_status(client, unit_id, start_register=10001)
-                run_status.append(status[0])
-                fault_status.append(status[1])
-                alarm_status.append(status[2])
-
-            # Save readings to database
-            save_to_database("vsd_temp", date, time_str, temperatures)
-            save_to_database("vsd_curr", date, time_str, currents)
-            save_to_database("vsd_freq", date, time_str, frequencies)
-            save_to_database("vsd_run", date, time_str, run_status)
-           # save_to_database("vsd_fault", date, time_str, fault_status)
-           # save_to_database("vsd_alarm", date, time_str, alarm_status)
-
-            # Wait for the next cycle
-            print("All units read. Waiting for the next interval...")
-            await asyncio.sleep(READ_INTERVAL)
+    rows = {}
+    last_status = dict(LAST_STATUS)
+    for timestamp, readings in cycles:
+        date, time_str = time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp)).split(" ")
+        for name, table_name in TABLES.items():
+            values = readings[name]
+            if table_name in STATUS_TABLES:
+                if last_status.get(table_name) == values:
+                    continue
+                last_status[table_name] = values
+            rows.setdefault(table_name, []).append([date, time_str] + values)
+
+    # Borrow a connection from the pool
+    async with DB_POOL.acquire() as connection:
+        # Reconnect if the server dropped the idle connection since the last flush
+        await connection.ping(reconnect=True)
+
+        async with connection.cursor() as cursor:
+            for table_name, table_rows in rows.items():
+                await cursor.executemany(INSERT_SQL[table_name], table_rows)
+
+        # Commit all rows at once
+        await connection.commit()
+
+    LAST_STATUS.update(last_status)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import vsd_monitor
+
+    asyncio.run(vsd_monitor.main(sys.modules[__name__]))
@@ -0,0 +1,452 @@
+import argparse
+import asyncio
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusException
+import numpy as np
+import importlib
+import time
+import os
+import signal
+import socket
+import sys
+
+from vsd_config import TOTAL_UNITS, VSD_NAMES
+
+# Configuration
+MODBUS_IP = "10.27.102.5"  # Shared IP address
+MODBUS_PORT = 502           # Default Modbus TCP port
+READ_INTERVAL = 60          # Interval in seconds (1 minute)
+MAX_INFLIGHT = int(os.environ.get("VSD_MAX_INFLIGHT", 4))  # Modbus connections opened, one request in flight on each; 1 for gateways accepting a single connection
+DATA_BLOCK_UNIT = None      # Gateway unit ID exposing all units' data registers as one contiguous block, 8 per unit (None = read per unit)
+STATUS_BLOCK_UNIT = None    # Gateway unit ID exposing all units' status inputs as one contiguous block, 8 per unit (None = read per unit)
+BATCH_CYCLES = 10           # Number of cycles buffered before writing to the database; a crash or kill -9 loses up to BATCH_CYCLES * READ_INTERVAL seconds (10 minutes) of readings
+
+# Database backend modules, selected with --backend
+BACKENDS = {
+    "sqlite": "vsd_monitoring_logging",
+    "mysql": "vsd_g3_read_ver12",
+}
+
+# Scaling factor and valid (min, max) range of each data register, starting at 40103
+SCALING_FACTORS = np.array([10, 10, 10, 10, 10, 10, 10, 10], dtype=float)
+VALID_RANGES = np.array([
+    (0, 50),    # Frequency: 0-50 Hz
+    (0, 200),   # Current: 0-200 A
+    (-50, 100), # Temperature: -50°C to 100°C
+    (-50, 100), # Add specific ranges for other registers as needed
+    (-50, 100),
+    (-50, 100),
+    (-50, 100),
+    (-50, 100), # Drive temperature, logged as the unit's temperature
+], dtype=float)
+
+# Run, fault and alarm status for each combination of discrete inputs 2, 3 and 7
+STATUS_TABLE = {
+    (run, fault, alarm): ("RUN" if run else "STOP", "FAULT" if fault else "NORMAL", "ALARM" if alarm else "NORMAL")
+    for run in (False, True) for fault in (False, True) for alarm in (False, True)
+}
+
+def grid_format(headers):
+    """
+    Builds the layout of a grid table with one row of readings under the given headers.
+    Columns are sized once for a date, a time and values up to 6 characters wide (e.g. NORMAL).
+
+    Returns:
+    - Tuple of (border line, header line, row format string).
+    """
+    widths = [10, 5] + [max(len(header), 6) for header in headers[2:]]
+    border = "+" + "+".join("-" * (width + 2) for width in widths) + "+"
+    row_format = "|" + "|".join(f" {{:>{width}}} " for width in widths) + "|"
+    return border, row_format.format(*headers), row_format
+
+# Table headers for display
+TEMP_HEADERS = ["Date", "Time"] + list(VSD_NAMES.values())
+CURRENT_HEADERS = ["Date", "Time"] + [f"Current_{name}" for name in VSD_NAMES.values()]
+FREQ_HEADERS = ["Date", "Time"] + [f"Freq_{name}" for name in VSD_NAMES.values()]
+STATUS_HEADERS = ["Date", "Time"] + [f"Status_{name}" for name in VSD_NAMES.values()]
+
+# Table layouts for display, built once
+TEMP_GRID = grid_format(TEMP_HEADERS)
+CURRENT_GRID = grid_format(CURRENT_HEADERS)
+FREQ_GRID = grid_format(FREQ_HEADERS)
+STATUS_GRID = grid_format(STATUS_HEADERS)
+
+# Cycles waiting to be written, as (timestamp, readings) tuples
+PENDING_READINGS = []
+
+async def save_readings(backend, timestamp, readings):
+    """
+    Buffer one cycle of readings and write the buffer once BATCH_CYCLES cycles are pending.
+
+    Parameters:
+    - backend: Database backend module the readings are written to.
+    - timestamp: Unix time of the cycle, in whole seconds.
+    - readings: Dict mapping reading name (temperature, current, frequency, run, fault, alarm)
+      to the list of values per unit.
+    """
+    PENDING_READINGS.append((timestamp, readings))
+    if len(PENDING_READINGS) >= BATCH_CYCLES:
+        await flush_readings(backend)
+
+async def flush_readings(backend):
+    """
+    Write all buffered cycles through the backend in a single transaction.
+    Cycles are put back in the buffer and retried on the next flush if the write fails.
+    """
+    if not PENDING_READINGS:
+        return
+
+    # Take the cycles out of the buffer first, so a flush interrupted by Ctrl+C or SIGTERM after the
+    # backend committed them does not leave them for the shutdown flush to write a second time
+    batch = PENDING_READINGS[:]
+    PENDING_READINGS.clear()
+
+    try:
+        await backend.save_cycles(batch)
+    except Exception as e:
+        print(f"Error saving readings: {e}")
+
+        # Backends only raise an Exception when nothing was committed
+        PENDING_READINGS[:0] = batch
+
+def stop_on_signal(signum, frame):
+    """
+    Handles SIGTERM (and SIGBREAK on Windows) by exiting through main()'s cleanup, as on Ctrl+C,
+    so the buffered cycles are written when a service manager stops the monitor.
+    """
+    print(f"Stopped by signal {signum}")
+    raise SystemExit(0)
+
+def show_readings(title, row, grid):
+    """
+    Print a row of readings as a grid table laid out by grid_format. Skipped when stdout is
+    not a terminal, e.g. when running as a service with output redirected to a log file.
+    Missing readings (None) are shown as empty cells.
+    """
+    if not sys.stdout.isatty():
+        return
+
+    border, header_line, row_format = grid
+    print(f"\n{title}")
+    print(border)
+    print(header_line)
+    print(border.replace("-", "="))
+    print(row_format.format(*("" if value is None else value for value in row)))
+    print(border)
+
+def set_socket_options(client):
+    """
+    Disable Nagle's algorithm and enable TCP keepalive on the Modbus connection, so small
+    requests are sent immediately and a silently dropped connection is detected.
+    """
+    # pymodbus exposes the asyncio transport on the client or on its protocol, depending on the version
+    transport = getattr(client, "transport", None) or getattr(getattr(client, "ctx", None), "transport", None)
+    sock = transport.get_extra_info("socket") if transport is not None else None
+    if sock is None:
+        print("Could not set socket options: Modbus connection not available")
+        return
+
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+def create_client():
+    """
+    Creates a Modbus TCP client that sets the socket options on every connection it opens.
+
+    pymodbus calls the protocol's callback_connected from connection_made for each new socket,
+    including reconnects it makes internally, so the options are applied there.
+    pymodbus' own background reconnect is disabled (reconnect_delay=0) so ensure_connected()
+    is the only place connections are re-established.
+    """
+    client = AsyncModbusTcpClient(MODBUS_IP, port=MODBUS_PORT, reconnect_delay=0)
+    callback_connected = client.ctx.callback_connected
+
+    def on_connected():
+        set_socket_options(client)
+        callback_connected()
+
+    client.ctx.callback_connected = on_connected
+    return client
+
+def scale_registers(unit_id, start_register, registers, scaling_factors, valid_ranges):
+    """
+    Scales raw register values and replaces values outside their valid range with None.
+    """
+    # Scale and range-check all registers at once
+    scaled = np.asarray(registers, dtype=float) / scaling_factors
+    in_range = (scaled >= valid_ranges[:, 0]) & (scaled <= valid_ranges[:, 1])
+
+    for i in np.flatnonzero(~in_range):
+        print(f"{VSD_NAMES[unit_id]}: Register {start_register + i} value {scaled[i]} out of range {tuple(valid_ranges[i].tolist())}")
+
+    return [value if valid else None for value, valid in zip(scaled.tolist(), in_range.tolist())]
+
+async def read_vsd_data_batch(client, unit_id, start_register, count, scaling_factors, valid_ranges):
+    """
+    Reads multiple registers from a Modbus unit asynchronously and extracts specified data.
+
+    Parameters:
+    - client: AsyncModbusTcpClient instance.
+    - unit_id: ID of the Modbus unit to read.
+    - start_register: Starting register address.
+    - count: Number of registers to read.
+    - scaling_factors: Array of scaling factors for each register value.
+    - valid_ranges: Array of valid ranges (min, max) for each register value.
+
+    Returns:
+    - List of processed values (None if invalid or failed).
+    """
+    try:
+        address = start_register - 40001  # Adjust for zero-based addressing
+        response = await client.read_holding_registers(address, count=count, slave=unit_id)
+
+        if response.isError():
+            print(f"{VSD_NAMES[unit_id]}: Modbus Error - {response}")
+            return [None] * count
+
+        return scale_registers(unit_id, start_register, response.registers, scaling_factors, valid_ranges)
+
+    except Exception as e:
+        print(f"{VSD_NAMES[unit_id]}: Exception - {e}")
+        return [None] * count
+
+async def read_vsd_data_block(client, start_register):
+    """
+    Reads the data registers of all units with a single request to DATA_BLOCK_UNIT.
+    The gateway must map the 8 registers of each unit contiguously, starting with unit 1.
+
+    Returns:
+    - List of processed values, one list per unit, or None if the block could not be read.
+    """
+    try:
+        address = start_register - 40001  # Adjust for zero-based addressing
+        response = await client.read_holding_registers(address, count=8 * TOTAL_UNITS, slave=DATA_BLOCK_UNIT)
+
+        if response.isError():
+            print(f"Error reading data block from unit {DATA_BLOCK_UNIT}: {response}")
+            return None
+
+        return [
+            scale_registers(unit_id, start_register, response.registers[(unit_id - 1) * 8:unit_id * 8],
+                            SCALING_FACTORS, VALID_RANGES)
+            for unit_id in range(1, TOTAL_UNITS + 1)
+        ]
+
+    except Exception as e:
+        print(f"Exception while reading data block from unit {DATA_BLOCK_UNIT}: {e}")
+        return None
+
+def decode_status(bits):
+    """
+    Decodes the 8 discrete inputs of a unit into its run, fault and alarm status.
+    """
+    # Look up bit 2, 3, and 7 (0-based indexing)
+    return STATUS_TABLE[bits[2], bits[3], bits[7]]
+
+async def read_vsd_status(client, unit_id, start_register):
+    """
+    Reads a coil register for the status (RUN/STOP) using discrete inputs.
+    """
+    try:
+        address = start_register - 10001  # Adjust for zero-based addressing
+        response = await client.read_discrete_inputs(address=address, count=8, slave=unit_id)
+
+        if not response.isError():
+            return decode_status(response.bits)
+        else:
+            print(f"Error reading discrete inputs from unit {unit_id}: {response}")
+            return [None, None, None]
+
+    except ModbusException as e:
+        print(f"ModbusException while reading status from unit {unit_id}: {e}")
+        return [None, None, None]
+    except Exception as e:
+        print(f"Exception while reading status from unit {unit_id}: {e}")
+        return [None, None, None]
+
+async def read_vsd_status_block(client, start_register):
+    """
+    Reads the status inputs of all units with a single request to STATUS_BLOCK_UNIT.
+    The gateway must map the 8 inputs of each unit contiguously, starting with unit 1.
+
+    Returns:
+    - List of statuses, one per unit, or None if the block could not be read.
+    """
+    try:
+        address = start_register - 10001  # Adjust for zero-based addressing
+        response = await client.read_discrete_inputs(address=address, count=8 * TOTAL_UNITS, slave=STATUS_BLOCK_UNIT)
+
+        if response.isError():
+            print(f"Error reading status block from unit {STATUS_BLOCK_UNIT}: {response}")
+            return None
+
+        return [decode_status(response.bits[i * 8:(i + 1) * 8]) for i in range(TOTAL_UNITS)]
+
+    except Exception as e:
+        print(f"Exception while reading status block from unit {STATUS_BLOCK_UNIT}: {e}")
+        return None
+
+async def read_unit(client, unit_id, values=None, status=None):
+    """
+    Reads the data registers and the status inputs of a single unit.
+    Either read is skipped when its result is passed in, e.g. from a block read.
+    Both reads go over the same connection, which pymodbus serves one request at a time;
+    reads only overlap across units on different connections (see poll_units).
+
+    Returns:
+    - Tuple of (values, status) as returned by read_vsd_data_batch and read_vsd_status.
+    """
+    reads = []
+    if values is None:
+        reads.append(read_vsd_data_batch(
+            client, unit_id, 40103, count=8,
+            scaling_factors=SCALING_FACTORS,
+            valid_ranges=VALID_RANGES
+        ))
+    if status is None:
+        reads.append(read_vsd_status(client, unit_id, start_register=10001))
+
+    results = list(await asyncio.gather(*reads))
+
+    if values is None:
+        values = results.pop(0)
+    if status is None:
+        status = results.pop(0)
+    return values, status
+
+async def ensure_connected(client):
+    """
+    Connects the Modbus client if it is not connected, e.g. at startup or after the
+    gateway dropped the connection.
+
+    Returns:
+    - True if the client is connected.
+    """
+    if client.connected:
+        return True
+
+    print(f"Connecting to Modbus gateway {MODBUS_IP}:{MODBUS_PORT}...")
+    try:
+        await client.connect()
+    except Exception as e:
+        print(f"Exception while connecting to Modbus gateway: {e}")
+
+    if not client.connected:
+        print("Modbus gateway not reachable, retrying next cycle")
+        return False
+
+    return True
+
+async def poll_units(clients, backend):
+    """
+    Reads all units once, saves the readings and displays them.
+
+    Parameters:
+    - clients: Connected AsyncModbusTcpClient instances the units are spread over.
+    - backend: Database backend module the readings are written to.
+    """
+    # Record current time, and the date and time shown on the console
+    timestamp = int(time.time())
+    date, time_str = time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp)).split(" ")
+
+    # Read all devices, one slot per unit
+    temperatures = [None] * TOTAL_UNITS
+    currents = [None] * TOTAL_UNITS
+    frequencies = [None] * TOTAL_UNITS
+    run_status = [None] * TOTAL_UNITS
+    fault_status = [None] * TOTAL_UNITS
+    alarm_status = [None] * TOTAL_UNITS
+
+    # Read all data registers and status inputs at once if the gateway exposes them as blocks
+    block_values = [None] * TOTAL_UNITS
+    if DATA_BLOCK_UNIT is not None:
+        block_values = await read_vsd_data_block(clients[0], start_register=40103) or block_values
+    block_statuses = [None] * TOTAL_UNITS
+    if STATUS_BLOCK_UNIT is not None:
+        block_statuses = await read_vsd_status_block(clients[0], start_register=10001) or block_statuses
+
+    # Read all units, spread round-robin over the connections so each has one request in flight
+    results = await asyncio.gather(*(
+        read_unit(clients[(unit_id - 1) % len(clients)], unit_id, block_values[unit_id - 1], block_statuses[unit_id - 1])
+        for unit_id in range(1, TOTAL_UNITS + 1)
+    ))
+
+    # Results are in unit order, so each unit fills its own slot
+    for i, (values, status) in enumerate(results):
+        frequencies[i], currents[i], temperatures[i] = values[0], values[1], values[7]
+        run_status[i], fault_status[i], alarm_status[i] = status
+
+    # Save readings to database
+    await save_readings(backend, timestamp, {
+        "temperature": temperatures,
+        "current": currents,
+        "frequency": frequencies,
+        "run": run_status,
+        "fault": fault_status,
+        "alarm": alarm_status,
+    })
+
+    # Display readings
+    show_readings("Temperature Readings:", [date, time_str] + temperatures, TEMP_GRID)
+    show_readings("Current Readings:", [date, time_str] + currents, CURRENT_GRID)
+    show_readings("Frequency Readings:", [date, time_str] + frequencies, FREQ_GRID)
+    show_readings("RUN Status:", [date, time_str] + run_status, STATUS_GRID)
+    show_readings("FAULT Status:", [date, time_str] + fault_status, STATUS_GRID)
+    show_readings("ALARM Status:", [date, time_str] + alarm_status, STATUS_GRID)
+
+async def main(backend):
+    """
+    Poll all units every READ_INTERVAL seconds and log the readings to a database.
+
+    MAX_INFLIGHT Modbus connections are kept open across cycles and only re-established when
+    lost. pymodbus handles one request at a time per connection, so the units are read over
+    several connections in parallel. Units are spread over the connections that are up;
+    cycles without any connection are skipped rather than logged as empty readings.
+
+    Parameters:
+    - backend: Database backend module (see BACKENDS) providing initialize_database,
+      save_cycles and close_database.
+    """
+    # Stop cleanly when terminated by a service manager, not only on Ctrl+C
+    signal.signal(signal.SIGTERM, stop_on_signal)
+    if hasattr(signal, "SIGBREAK"):
+        signal.signal(signal.SIGBREAK, stop_on_signal)
+
+    # Initialize the database
+    await backend.initialize_database()
+
+    # Create Modbus TCP clients, one per concurrent request
+    clients = [create_client() for _ in range(MAX_INFLIGHT)]
+
+    try:
+        # Cycles are scheduled from a fixed start so the time spent reading does not add up as drift
+        next_cycle = time.monotonic()
+
+        while True:
+            connected = await asyncio.gather(*(ensure_connected(client) for client in clients))
+            connected_clients = [client for client, is_connected in zip(clients, connected) if is_connected]
+            if connected_clients:
+                await poll_units(connected_clients, backend)
+                print("All units read. Waiting for the next interval...")
+
+            # Wait for the next cycle
+            next_cycle += READ_INTERVAL
+            now = time.monotonic()
+            if next_cycle < now:
+                # Fell behind by more than an interval; skip the missed cycles
+                next_cycle += (now - next_cycle) // READ_INTERVAL * READ_INTERVAL + READ_INTERVAL
+            await asyncio.sleep(next_cycle - now)
+    finally:
+        for client in clients:
+            client.close()
+
+        # Write any cycles still buffered before exiting
+        await flush_readings(backend)
+        await backend.close_database()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll the VSDs over Modbus TCP and log the readings to a database.")
+    parser.add_argument("--backend", choices=BACKENDS, default="sqlite", help="Database to log to (default: sqlite)")
+    args = parser.parse_args()
+
+    asyncio.run(main(importlib.import_module(BACKENDS[args.backend])))
@@ -1,253 +1,201 @@
 import asyncio
-from pymodbus.client import AsyncModbusTcpClient
-from pymodbus.exceptions import ModbusException
-from tabulate import tabulate
-import sqlite3
-import datetime
+import aiosqlite
 import os
+import sys
 
-# Configuration
-MODBUS_IP = "10.27.102.5"  # Shared IP address
-MODBUS_PORT = 502           # Default Modbus TCP port
-TOTAL_UNITS = 13            # Number of devices
-READ_INTERVAL = 60          # Interval in seconds (1 minute)
-
-# VSD Names Mapping
-VSD_NAMES = {
-    1: "CT_9", 2: "CT_10", 3: "CT_11", 4: "CT_12",
-    5: "CT_13", 6: "CHWP_6", 7: "CHWP_7", 8: "CHWP_8",
-    9: "CHWP_9", 10: "CCP_6", 11: "CCP_7", 12: "CCP_8", 13: "CCP_9"
-}
+from vsd_config import VSD_NAMES
 
 # Database file path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_NAME = os.path.join(SCRIPT_DIR, "vsd_read.db")
 
-def initialize_database():
-    """
-    Initialize the SQLite database with separate tables for temperature, current, frequency, and status readings.
-    """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-
-    # Create temperature table
-    temp_columns = ", ".join([f"{name} REAL" for name in VSD_NAMES.values()])
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS vsd_temp (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            time TEXT NOT NULL,
-            {temp_columns}
-        )
-    """)
+# Readings stored in vsd_readings: (column suffix, column type, compatibility view)
+READINGS = {
+    "temperature": ("temp", "REAL", "vsd_temp"),
+    "current": ("current", "REAL", "vsd_current"),
+    "frequency": ("freq", "REAL", "vsd_freq"),
+    "run": ("run", "TEXT", "vsd_run"),
+    "fault": ("fault", "TEXT", "vsd_fault"),
+    "alarm": ("alarm", "TEXT", "vsd_alarm"),
+}
 
-    # Create current table
-    current_columns = ", ".join([f"{name} REAL" for name in VSD_NAMES.values()])
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS vsd_current (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            time TEXT NOT NULL,
-            {current_columns}
-        )
-    """)
+# Insert statement for one cycle, built once
+READING_COLUMNS = [f"{name}_{suffix}" for suffix, _, _ in READINGS.values() for name in VSD_NAMES.values()]
+PLACEHOLDERS = ", ".join(["?"] * (1 + len(READING_COLUMNS)))  # 1 for the timestamp, the rest for values
+INSERT_SQL = f"INSERT INTO vsd_readings (ts, {', '.join(READING_COLUMNS)}) VALUES ({PLACEHOLDERS})"
 
-    # Create frequency table
-    freq_columns = ", ".join([f"{name} REAL" for name in VSD_NAMES.values()])
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS vsd_freq (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            time TEXT NOT NULL,
-            {freq_columns}
+# Persistent database connection, opened once by initialize_database(); its queries run on a worker thread
+DB_CONN = None
+
+async def initialize_database():
+    """
+    Initialize the SQLite database with a single vsd_readings table holding one row per cycle,
+    keyed by Unix timestamp, and views exposing each reading under its former table name
+    (vsd_temp, vsd_current, ...) with the date and time columns derived from the timestamp.
+    The tables of older versions are replaced on first start (see migrate_legacy_tables).
+
+    Opens the connection that is reused by save_cycles for the lifetime of the process.
+    aiosqlite runs every query on the connection's own thread, so commits never block the
+    event loop and the Modbus reads of the next cycle.
+    WAL journaling with synchronous=NORMAL avoids an fsync per commit and lets readers
+    (web_display.py) query the database while the logger is writing. A large page cache and
+    memory-mapped I/O keep the hot pages of the growing tables resident.
+    """
+    global DB_CONN
+    DB_CONN = await aiosqlite.connect(DATABASE_NAME, isolation_level=None)
+    await DB_CONN.execute("PRAGMA journal_mode=WAL")
+    await DB_CONN.execute("PRAGMA synchronous=NORMAL")
+    await DB_CONN.execute("PRAGMA cache_size=-65536")      # 64 MB page cache
+    await DB_CONN.execute("PRAGMA mmap_size=268435456")    # Memory-map up to 256 MB of the file
+    await DB_CONN.execute("PRAGMA temp_store=MEMORY")
+    await DB_CONN.execute("PRAGMA optimize=0x10002")  # Analyze tables that need it, as recommended for long-lived connections
+
+    # Create the readings table, move the tables of older versions into it and replace them with views
+    # in one transaction, so readers (web_display.py) never find a reading's table missing
+    await DB_CONN.execute("BEGIN IMMEDIATE")
+    try:
+        await create_tables()
+        await DB_CONN.commit()
+    except BaseException:
+        # Close the connection too, its thread would otherwise keep the process from exiting
+        await DB_CONN.rollback()
+        await DB_CONN.close()
+        raise
+
+async def create_tables():
+    """
+    Create the vsd_readings table and the per-reading views, migrating the tables of older
+    versions first. Must run inside a transaction opened by the caller.
+    """
+    columns = ", ".join(
+        f"{name}_{suffix} {column_type}" for suffix, column_type, _ in READINGS.values() for name in VSD_NAMES.values()
+    )
+    await DB_CONN.execute(f"""
+        CREATE TABLE IF NOT EXISTS vsd_readings (
+            id INTEGER PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            {columns}
         )
     """)
 
-    # Create status tables
-    for table in ["vsd_run", "vsd_fault", "vsd_alarm"]:
-        status_columns = ", ".join([f"{name} TEXT" for name in VSD_NAMES.values()])
-        cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS {table} (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                time TEXT NOT NULL,
-                {status_columns}
-            )
+    # Move the rows of the per-reading tables written by older versions into vsd_readings
+    legacy_readings = []
+    for name, (_, _, view_name) in READINGS.items():
+        async with DB_CONN.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (view_name,)
+        ) as cursor:
+            if await cursor.fetchone():
+                legacy_readings.append(name)
+    if legacy_readings:
+        await migrate_legacy_tables(legacy_readings)
+
+    # Create one view per reading
+    for suffix, _, view_name in READINGS.values():
+        view_columns = ", ".join(f"{name}_{suffix} AS {name}" for name in VSD_NAMES.values())
+        await DB_CONN.execute(f"""
+            CREATE VIEW IF NOT EXISTS {view_name} AS
+            SELECT id,
+                   date(ts, 'unixepoch', 'localtime') AS date,
+                   strftime('%H:%M', ts, 'unixepoch', 'localtime') AS time,
+                   {view_columns}
+            FROM vsd_readings
         """)
 
-    conn.commit()
-    conn.close()
-
-def save_to_database(table_name, date, time, values):
+async def migrate_legacy_tables(legacy_readings):
     """
-    Save a single row of readings to the specified SQLite database table.
+    Move the rows of the per-reading tables written by older versions (vsd_temp, vsd_current, ...)
+    into vsd_readings and drop those tables. Runs inside the transaction of initialize_database(),
+    which creates the views replacing the dropped tables before committing.
+
+    Older versions inserted one row per table each cycle, but the tables were added at different
+    times and their ids do not line up. Rows are therefore matched on date, time and their position
+    within that minute, and stored in chronological order. Readings a cycle has no row for are NULL.
+
+    Parameters:
+    - legacy_readings: Names of the readings (keys of READINGS) whose old table still exists.
     """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    sources = {name: f"legacy_{READINGS[name][0]}" for name in legacy_readings}
+    numbered_tables = ", ".join(
+        f"{source} AS (SELECT *, ROW_NUMBER() OVER (PARTITION BY date, time ORDER BY id) AS seq FROM {READINGS[name][2]})"
+        for name, source in sources.items()
+    )
+    cycles = " UNION ".join(f"SELECT date, time, seq FROM {source}" for source in sources.values())
+    values = ", ".join(
+        f"{sources[reading]}.{name}" if reading in sources else "NULL"
+        for reading in READINGS for name in VSD_NAMES.values()
+    )
+    joins = " ".join(
+        f"LEFT JOIN {source} ON {source}.date = cycles.date AND {source}.time = cycles.time AND {source}.seq = cycles.seq"
+        for source in sources.values()
+    )
+
+    # Dates and times were written in local time; the 'utc' modifier converts them to Unix time
+    await DB_CONN.execute(f"""
+        WITH {numbered_tables}, cycles AS ({cycles})
+        INSERT INTO vsd_readings (ts, {', '.join(READING_COLUMNS)})
+        SELECT CAST(strftime('%s', cycles.date || ' ' || cycles.time, 'utc') AS INTEGER), {values}
+        FROM cycles {joins}
+        ORDER BY cycles.date, cycles.time, cycles.seq
+    """)
+    async with DB_CONN.execute("SELECT changes()") as cursor:
+        (moved,) = await cursor.fetchone()
+    print(f"Moved {moved} cycles from old tables into vsd_readings")
 
-    # Build placeholders dynamically based on TOTAL_UNITS
-    placeholders = ", ".join(["?"] * (2 + TOTAL_UNITS))  # 2 for date and time, the rest for values
+    for name in legacy_readings:
+        await DB_CONN.execute(f"DROP TABLE {READINGS[name][2]}")
 
-    # Insert query
-    insert_query = f"""
-        INSERT INTO {table_name} (date, time, {', '.join(VSD_NAMES.values())})
-        VALUES ({placeholders})
+async def close_database():
     """
-    cursor.execute(insert_query, [date, time] + values)
-    conn.commit()
-    conn.close()
+    Close the SQLite database connection, updating the query planner statistics first.
+    """
+    if DB_CONN is not None:
+        await DB_CONN.execute("PRAGMA optimize")
+        await DB_CONN.close()
 
-async def read_vsd_data_batch(client, unit_id, start_register, count, scaling_factors, valid_ranges):
+async def save_cycles(cycles):
     """
-    Reads multiple registers from a Modbus unit asynchronously and extracts specified data.
+    Save buffered cycles to the SQLite database in a single transaction, one row per cycle.
+    Raises an Exception only if nothing was committed; when cancelled, the cycles are still saved.
 
     Parameters:
-    - client: AsyncModbusTcpClient instance.
-    - unit_id: ID of the Modbus unit to read.
-    - start_register: Starting register address.
-    - count: Number of registers to read.
-    - scaling_factors: List of scaling factors for each register value.
-    - valid_ranges: List of valid ranges (min, max) for each register value.
-
-    Returns:
-    - List of processed values (None if invalid or failed).
+    - cycles: List of (timestamp, readings) tuples, readings mapping each reading name to its values per unit.
     """
+    rows = [
+        [timestamp] + [value for name in READINGS for value in readings[name]]
+        for timestamp, readings in cycles
+    ]
+
+    # Statements handed to aiosqlite's thread run even if this task is cancelled while waiting for them
+    # (Ctrl+C, SIGTERM), so an interrupted save completes the missing steps instead of abandoning the
+    # transaction. The batch is then written exactly once: the caller has already taken it out of its buffer
+    step = "begin"
     try:
-        address = start_register - 40001  # Adjust for zero-based addressing
-        response = await client.read_holding_registers(address, count=count, slave=unit_id)
-
-        if response.isError():
-            print(f"{VSD_NAMES[unit_id]}: Modbus Error")
-            return [None] * count
-
-        values = []
-        for i, raw_value in enumerate(response.registers):
-            scaled_value = raw_value / scaling_factors[i]
-            valid_range = valid_ranges[i]
-
-            if valid_range[0] <= scaled_value <= valid_range[1]:
-                values.append(scaled_value)
-            else:
-                print(f"{VSD_NAMES[unit_id]}: Value {scaled_value} out of range {valid_range}")
-                values.append(None)
-
-        return values
-
-    except Exception as e:
-        print(f"{VSD_NAMES[unit_id]}: Exception - {e}")
-        return [None] * count
-
-async def read_vsd_status(client, unit_id, start_register):
-    """
-    Reads a coil register for the status (RUN/STOP) using discrete inputs.
-    """
+        # Take the write lock up front so the transaction cannot fail midway on a lock upgrade
+        await DB_CONN.execute("BEGIN IMMEDIATE")
+        step = "insert"
+        await DB_CONN.executemany(INSERT_SQL, rows)
+        step = "commit"
+
+        # Commit all rows at once
+        await DB_CONN.commit()
+    except Exception:
+        # Nothing was committed; roll back so the next flush can begin a new transaction
+        await DB_CONN.rollback()
+        raise
+    except BaseException:
+        if step == "begin":
+            await DB_CONN.executemany(INSERT_SQL, rows)
+        await DB_CONN.commit()
+        raise
+
+    # Keep the query planner statistics current while the logger runs; a no-op unless tables grew a lot.
+    # Errors are only reported, since the cycles are already committed and must not be written again
     try:
-        address = start_register - 10001  # Adjust for zero-based addressing
-        response = await client.read_discrete_inputs(address=address, count=8, slave=unit_id)
-
-        if not response.isError():
-            # Extract bit 2, 3, and 7 (0-based indexing)
-            bit_2 = response.bits[2]
-            bit_3 = response.bits[3]
-            bit_7 = response.bits[7]
-
-            # Return status as 'RUN' or 'STOP'
-            return ["RUN" if bit_2 else "STOP", "FAULT" if bit_3 else "NORMAL", "ALARM" if bit_7 else "NORMAL"]
-        else:
-            print(f"Error reading discrete inputs from unit {unit_id}: {response}")
-            return [None, None, None]
-
-    except ModbusException as e:
-        print(f"ModbusException while reading status from unit {unit_id}: {e}")
-        return [None, None, None]
+        await DB_CONN.execute("PRAGMA optimize")
     except Exception as e:
-        print(f"Exception while reading status from unit {unit_id}: {e}")
-        return [None, None, None]
-
-async def main():
-    # Initialize the database
-    initialize_database()
-
-    # Create Modbus TCP client
-    async with AsyncModbusTcpClient(MODBUS_IP, port=MODBUS_PORT) as client:
-
-        # Prepare table headers for display
-        temp_headers = ["Date", "Time"] + list(VSD_NAMES.values())
-        current_headers = ["Date", "Time"] + [f"Current_{name}" for name in VSD_NAMES.values()]
-        freq_headers = ["Date", "Time"] + [f"Freq_{name}" for name in VSD_NAMES.values()]
-        status_headers = ["Date", "Time"] + [f"Status_{name}" for name in VSD_NAMES.values()]
-
-        while True:
-            # Record current date and time
-            now = datetime.datetime.now()
-            date = now.strftime("%Y-%m-%d")
-            time_str = now.strftime("%H:%M")
-
-            # Read all devices
-            temperatures = []
-            currents = []
-            frequencies = []
-            run_status = []
-            fault_status = []
-            alarm_status = []
-
-            for unit_id in range(1, TOTAL_UNITS + 1):
-                # Read temperature, current, and frequency
-                values = await read_vsd_data_batch(
-                    client, unit_id, 40103, count=8,
-                    scaling_factors=[10, 10, 10, 10, 10, 10, 10, 10],
-                    valid_ranges=[(0, 50), (0, 200), (-50, 100)] + [(-50, 100)] * 5
-                )
-
-                frequency, current, temperature = values[0], values[1], values[7]
-
-                frequencies.append(frequency)
-                currents.append(current)
-                temperatures.append(temperature)
-
-                # Read status
-                status = await read_vsd_status(client, unit_id, start_register=10001)
-                run_status.append(status[0])
-                fault_status.append(status[1])
-                alarm_status.append(status[2])
-
-            # Save readings to database
-            save_to_database("vsd_temp", date, time_str, temperatures)
-            save_to_database("vsd_current", date, time_str, currents)
-            save_to_database("vsd_freq", date, time_str, frequencies)
-            save_to_database("vsd_run", date, time_str, run_status)
-            save_to_database("vsd_fault", date, time_str, fault_status)
-            save_to_database("vsd_alarm", date, time_str, alarm_status)
-
-            # Display readings
-            temp_row = [date, time_str] + temperatures
-            current_row = [date, time_str] + currents
-            freq_row = [date, time_str] + frequencies
-            run_row = [date, time_str] + run_status
-            fault_row = [date, time_str] + fault_status
-            alarm_row = [date, time_str] + alarm_status
-
-            print("\nTemperature Readings:")
-            print(tabulate([temp_row], headers=temp_headers, tablefmt="grid"))
-
-            print("\nCurrent Readings:")
-            print(tabulate([current_row], headers=current_headers, tablefmt="grid"))
-
-            print("\nFrequency Readings:")
-            print(tabulate([freq_row], headers=freq_headers, tablefmt="grid"))
-
-            print("\nRUN Status:")
-            print(tabulate([run_row], headers=status_headers, tablefmt="grid"))
-
-            print("\nFAULT Status:")
-            print(tabulate([fault_row], headers=status_headers, tablefmt="grid"))
-
-            print("\nALARM Status:")
-            print(tabulate([alarm_row], headers=status_headers, tablefmt="grid"))
-
-            # Wait for the next cycle
-            print("All units read. Waiting for the next interval...")
-            await asyncio.sleep(READ_INTERVAL)
+        print(f"Error optimizing database: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import vsd_monitor
+
+    asyncio.run(vsd_monitor.main(sys.modules[__name__]))
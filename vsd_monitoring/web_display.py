@@ -1,31 +1,70 @@
-from flask import Flask, render_template, request
+from flask import Flask, abort, make_response, render_template, request
 import sqlite3
+import threading
 import os
 
 # Flask app initialization
 app = Flask(__name__)
 
+# Seconds browsers may reuse a page. The logger writes a batch every BATCH_CYCLES * READ_INTERVAL
+# seconds (10 minutes); this bounds how late a new batch shows up while absorbing repeated reloads
+CACHE_MAX_AGE = 30
+
+# Address the web server listens on
+HOST = "0.0.0.0"
+PORT = 5000
+
 # Database path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_NAME = os.path.join(SCRIPT_DIR, "vsd_read.db")
 
+# Per-thread database connection, reused across requests
+DB_LOCAL = threading.local()
+
+# Tables that can be displayed, and the queries run against them, built once
+ALLOWED_TABLES = ["vsd_temp", "vsd_current"]
+LATEST_ID_QUERIES = {table_name: f"SELECT MAX(id) FROM {table_name}" for table_name in ALLOWED_TABLES}
+QUERIES = {table_name: f"SELECT * FROM {table_name} ORDER BY id DESC LIMIT 10" for table_name in ALLOWED_TABLES}
+
+# Last rows fetched per table, as (latest id, rows, column names)
+TABLE_CACHE = {}
+
+
+def get_connection():
+    """
+    Return the SQLite connection of the current thread, opening it on first use.
+    """
+    conn = getattr(DB_LOCAL, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_NAME)
+        DB_LOCAL.conn = conn
+    return conn
+
 
 def fetch_data_from_table(table_name):
     """
-    Fetch the last 10 rows from the specified SQLite database table.
+    Fetch the last 10 rows from the specified SQLite database table, which must be in ALLOWED_TABLES.
+    The rows are cached and only fetched again once the table's latest id changes.
     """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
+
+    # Reuse the cached rows while no new row has been written
+    cursor.execute(LATEST_ID_QUERIES[table_name])
+    latest_id = cursor.fetchone()[0]
+    cached = TABLE_CACHE.get(table_name)
+    if cached is not None and cached[0] == latest_id:
+        cursor.close()
+        return cached[1], cached[2]
 
     # Fetch the last 10 rows
-    query = f"SELECT * FROM {table_name} ORDER BY id DESC LIMIT 10"
-    cursor.execute(query)
+    cursor.execute(QUERIES[table_name])
     rows = cursor.fetchall()
 
     # Fetch the column names
     column_names = [description[0] for description in cursor.description]
 
-    conn.close()
+    cursor.close()
+    TABLE_CACHE[table_name] = (latest_id, rows, column_names)
     return rows, column_names
 
 
@@ -34,24 +73,32 @@ def index():
     """
     Route to display data from a selected table using a dropdown list.
     """
-    tables = ["vsd_temp", "vsd_current"]  # List of available tables
     selected_table = "vsd_temp"  # Default table to display
 
     if request.method == "POST":
         selected_table = request.form.get("table_name", "vsd_temp")
 
+    # Only tables from the allowlist are ever put into a query
+    if selected_table not in ALLOWED_TABLES:
+        abort(400)
+
     try:
         # Fetch data from the selected table
         data, columns = fetch_data_from_table(selected_table)
 
-        # Render the template with data
-        return render_template(
-            "table_dropdown.html", tables=tables, selected_table=selected_table, rows=data, columns=columns
-        )
+        # Render the template with data, letting browsers reuse it for CACHE_MAX_AGE seconds
+        response = make_response(render_template(
+            "table_dropdown.html", tables=ALLOWED_TABLES, selected_table=selected_table, rows=data, columns=columns
+        ))
+        response.cache_control.public = True
+        response.cache_control.max_age = CACHE_MAX_AGE
+        return response
 
     except Exception as e:
         return f"Error: {e}"
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Serve with waitress, which handles requests on a pool of threads, instead of the development server
+    from waitress import serve
+    serve(app, host=HOST, port=PORT)